@@ -1,18 +1,26 @@
-from zipfile import ZipFile
+from bisect import bisect_right
+from zipfile import ZIP_DEFLATED, ZipFile
 from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any
+import asyncio
+import io
 import logging
 import os
+import re
+import shutil
 import tempfile
 from docx import Document
-import shutil
+from docx.oxml.ns import qn
 from docx.shared import Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-import subprocess
+from concurrent.futures import ProcessPoolExecutor
 from fastapi.responses import FileResponse
-from datetime import datetime, timedelta
+from starlette.background import BackgroundTask
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import chain
 import hijri_converter  # pip install hijri-converter
 
 app = FastAPI()
@@ -50,7 +58,6 @@ def embed_fonts(doc):
     """
     try:
         from docx.oxml import OxmlElement
-        from docx.oxml.ns import qn
         
         # Create new settings element if it doesn't exist
         if not doc.settings._element:
@@ -58,20 +65,13 @@ def embed_fonts(doc):
         
         settings = doc.settings._element
         
-        # Try to add the embedSystemFonts setting
-        embed_fonts_elm = OxmlElement('w:embedSystemFonts')
-        embed_fonts_elm.set(qn('w:val'), 'true')
-        settings.append(embed_fonts_elm)
-        
-        # Try to add embedTrueTypeFonts setting
-        embed_tt_fonts = OxmlElement('w:embedTrueTypeFonts')
-        embed_tt_fonts.set(qn('w:val'), 'true')
-        settings.append(embed_tt_fonts)
-        
-        # Add saveSubsetFonts setting
-        save_subset = OxmlElement('w:saveSubsetFonts')
-        save_subset.set(qn('w:val'), 'true')
-        settings.append(save_subset)
+        # Add embedSystemFonts, embedTrueTypeFonts and saveSubsetFonts settings,
+        # skipping any the document already has
+        for tag in ('w:embedSystemFonts', 'w:embedTrueTypeFonts', 'w:saveSubsetFonts'):
+            if settings.find(qn(tag)) is None:
+                setting = OxmlElement(tag)
+                setting.set(qn('w:val'), 'true')
+                settings.append(setting)
         
         logger.info("Added font embedding settings to document")
         return True
@@ -81,38 +81,79 @@ def embed_fonts(doc):
 
 # Arabic day names
 ARABIC_DAY_NAMES = ["الأحد", "الإثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة", "السبت"]
+# Arabic day names indexed by Python's weekday() (Monday=0), converted from the Arabic convention (Sunday=0)
+_ARABIC_BY_PY_WEEKDAY = tuple(ARABIC_DAY_NAMES[(i + 1) % 7] for i in range(7))
+
+# Umm al-Qura month start days (Reduced Julian Day numbers) and the offset from date ordinals
+# These are hijri-converter internals; if they are missing, every conversion uses hijri_converter.convert
+try:
+    from hijri_converter.ummalqura import HIJRI_OFFSET as _UMMALQURA_HIJRI_OFFSET
+    from hijri_converter.ummalqura import MONTH_STARTS as _UMMALQURA_MONTH_STARTS
+except ImportError:
+    _UMMALQURA_HIJRI_OFFSET = _UMMALQURA_MONTH_STARTS = None
+_ORDINAL_TO_RJD = 1721425 - 2400000
+
+def _ordinal_to_hijri(ordinal):
+    """
+    Convert a Gregorian date ordinal to a Hijri (year, month, day) tuple
+    Uses the same month table as hijri-converter without building its date objects
+    Returns None if the table is unavailable or the date is outside its range
+    """
+    if _UMMALQURA_MONTH_STARTS is None:
+        return None
+
+    rjd = ordinal + _ORDINAL_TO_RJD
+    if not _UMMALQURA_MONTH_STARTS[0] <= rjd < _UMMALQURA_MONTH_STARTS[-1]:
+        return None
+
+    index = bisect_right(_UMMALQURA_MONTH_STARTS, rjd) - 1
+    years, month_index = divmod(index + _UMMALQURA_HIJRI_OFFSET, 12)
+    return years + 1, month_index + 1, rjd - _UMMALQURA_MONTH_STARTS[index] + 1
+
+@lru_cache(maxsize=256)
+def _gregorian_to_hijri(year, month, day):
+    """
+    Convert a Gregorian calendar day to Hijri
+    Cached per (year, month, day) so different ISO spellings of the same day share an entry
+    """
+    date_obj = date(year, month, day)
 
+    # Get Arabic day name
+    arabic_day_name = _ARABIC_BY_PY_WEEKDAY[date_obj.weekday()]
+
+    # Convert to Hijri directly from the Umm al-Qura table, falling back to hijri-converter
+    # (which raises for out-of-range dates) when the table does not cover the date
+    hijri = _ordinal_to_hijri(date_obj.toordinal())
+    if hijri is None:
+        hijri_obj = hijri_converter.convert.Gregorian(year, month, day).to_hijri()
+        hijri = (hijri_obj.year, hijri_obj.month, hijri_obj.day)
+    hijri_year, hijri_month, hijri_day = hijri
+
+    # Format the date components as zero-padded strings
+    hijri_parts = (f"{hijri_day:02d}", f"{hijri_month:02d}", str(hijri_year))
+    gregorian_parts = (f"{day:02d}", f"{month:02d}", str(year))
+
+    # Log the conversion for debugging (only reached on cache misses)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Converted date: Gregorian %s to Hijri %s, Day: %s",
+                     '/'.join(gregorian_parts), '/'.join(hijri_parts), arabic_day_name)
+
+    return arabic_day_name, hijri_parts, gregorian_parts
+
+@lru_cache(maxsize=4096)
 def convert_to_hijri(date_str):
     """
     Convert a Gregorian date string to Hijri date
-    Returns a tuple (hijri_date_str, arabic_day_name, gregorian_date_str)
+    Returns a tuple (arabic_day_name, (hijri_day, hijri_month, hijri_year), (gregorian_day, gregorian_month, gregorian_year))
+    with each component as a zero-padded string
+    Results are memoized on the raw date string; use convert_to_hijri.cache_clear() to reset
     """
     try:
         # Parse the date string to a datetime object
-        date_obj = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        
-        # Get Arabic day name
-        day_of_week = date_obj.weekday()
-        # Convert to Arabic convention (Sunday=0, Monday=1, etc.)
-        arabic_day_index = (day_of_week + 1) % 7
-        arabic_day_name = ARABIC_DAY_NAMES[arabic_day_index]
-        
-        # Convert to Hijri using hijri-converter
-        hijri = hijri_converter.convert.Gregorian(
-            date_obj.year, 
-            date_obj.month, 
-            date_obj.day
-        ).to_hijri()
-        
-        # Format dates as strings
-        hijri_date_str = f"{hijri.day:02d}/{hijri.month:02d}/{hijri.year}"
-        gregorian_date_str = f"{date_obj.day:02d}/{date_obj.month:02d}/{date_obj.year}"
-        
-        # Log the conversion for debugging
-        logger.info(f"Converted date: Gregorian {gregorian_date_str} to Hijri {hijri_date_str}, Day: {arabic_day_name}")
-        
-        return hijri_date_str, arabic_day_name, gregorian_date_str
-    
+        date_obj = datetime.fromisoformat(date_str.strip().replace('Z', '+00:00'))
+
+        return _gregorian_to_hijri(date_obj.year, date_obj.month, date_obj.day)
+
     except Exception as e:
         logger.error(f"Error converting date: {e}")
         raise ValueError(f"Invalid date format: {date_str}")
@@ -127,28 +168,52 @@ def set_cell_style(cell):
             run.bold = True
         paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER  # توسيط النص داخل الخلية
 
-def process_document(date_info, people, template_file, output_file):
+@lru_cache(maxsize=1)
+def _template_bytes(template_file, mtime):
     """
-    Process the document with the given data
-    date_info is a tuple (hijri_date_str, arabic_day_name, gregorian_date_str)
+    Return the template file's bytes with font embedding settings already applied
+    Keyed on the file's mtime so edits to the template invalidate the cache
     """
-    # نسخ الملف إلى ملف جديد
-    shutil.copy(template_file, output_file)
-    doc = Document(output_file)
+    doc = Document(template_file)
+    embed_fonts(doc)
 
-    # استخدم التاريخ والبيانات المرسلة
-    hijri_date_str, day, gregorian_date_str = date_info
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
 
-    # Prepare replacements based on the date data
-    replacements = {
-        "(اليوم)": day,
-        "[D]": hijri_date_str.split('/')[0],
-        "[M]": hijri_date_str.split('/')[1],
-        "[Y]": hijri_date_str.split('/')[2],
-        "[d]": gregorian_date_str.split('/')[0],
-        "[m]": gregorian_date_str.split('/')[1],
-        "[yyyy]": gregorian_date_str.split('/')[2],
-    }
+def replace_in_paragraph(paragraph, pattern, replacements):
+    """
+    Replace placeholders in a paragraph by editing its runs in place
+    Keeps the paragraph and run formatting that the cell.text setter would discard; content
+    controls in the paragraph are still removed, as the setter did
+    """
+    runs = paragraph.runs
+    if not runs:
+        return
+
+    # المفتاح قد يكون موزعاً على أكثر من run، لذا نستبدل في النص المجمع
+    paragraph_text = ''.join(run.text for run in runs)
+    new_text = pattern.sub(lambda m: str(replacements[m.group()]), paragraph_text)
+    if new_text == paragraph_text:
+        return
+
+    # وضع النص الجديد في أول run يحتوي على نص فعلي (وليس مسافة فقط) وحذف الباقي
+    target = next((run for run in runs if run.text.strip()), runs[0])
+    target.text = new_text
+    for run in runs:
+        if run is not target:
+            run._r.getparent().remove(run._r)
+
+    # حذف عناصر التحكم (مثل مربع الاختيار ☒) كما كان يفعل cell.text، لأن قيم الاستبدال تضيفها بنفسها
+    for sdt in paragraph._p.findall(qn('w:sdt')):
+        paragraph._p.remove(sdt)
+
+def build_people_context(people):
+    """
+    Prepare the people-dependent data shared by every date in a request
+    Returns a dict with the people list, their placeholder replacements and the set of their field values
+    """
+    replacements = {}
 
     num_people = len(people)
     # استبدال العدد في المكان المخصص للأرقام (ع)
@@ -185,42 +250,87 @@ def process_document(date_info, people, template_file, output_file):
         replacements["(اولهم)"] = people[0].name
         replacements["(اخرهم)"] = people[-1].name
 
+    return {
+        "people": people,
+        "replacements": replacements,
+        "person_tokens": frozenset(chain.from_iterable((p.name, p.nationality, p.id_number) for p in people)),
+    }
+
+def process_document(date_info, people_ctx, template_bytes, output_file):
+    """
+    Process the document with the given data
+    date_info is the tuple returned by convert_to_hijri
+    people_ctx is the dict returned by build_people_context
+    template_bytes is the raw content of the template file
+    """
+    # تحميل القالب من الذاكرة بدلاً من نسخه من القرص لكل تاريخ
+    doc = Document(io.BytesIO(template_bytes))
+
+    # استخدم التاريخ والبيانات المرسلة
+    day, (hijri_day, hijri_month, hijri_year), (gregorian_day, gregorian_month, gregorian_year) = date_info
+    people = people_ctx["people"]
+    num_people = len(people)
+    person_tokens = people_ctx["person_tokens"]
+
+    # Prepare replacements based on the date data
+    replacements = {
+        **people_ctx["replacements"],
+        "(اليوم)": day,
+        "[D]": hijri_day,
+        "[M]": hijri_month,
+        "[Y]": hijri_year,
+        "[d]": gregorian_day,
+        "[m]": gregorian_month,
+        "[yyyy]": gregorian_year,
+    }
+
+    # تجميع كل المفاتيح في تعبير واحد (الأطول أولاً) لاستبدالها بمرور واحد لكل خلية
+    replacement_pattern = re.compile('|'.join(
+        re.escape(key) for key in sorted(replacements, key=len, reverse=True)
+    ))
+
+    # جدول التنسيقات: (الحجم، عريض، الخط، المحاذاة) لكل نص، None تعني عدم التغيير
+    notice_style = (Pt(15), False, 'Times New Roman (Headings CS)', WD_PARAGRAPH_ALIGNMENT.RIGHT)
+    default_style = (Pt(15), True, 'Times New Roman (Headings CS)', None)
+    person_style = (Pt(15), True, None, WD_PARAGRAPH_ALIGNMENT.RIGHT)
+    # الإدخالات اللاحقة لها الأولوية: التاريخ يغلب بيانات الزوار، واليوم/الشهر يغلبان السنة
+    token_style = {token: person_style for token in person_tokens}
+    token_style[day] = person_style
+    for key, alignment in (("[Y]", WD_PARAGRAPH_ALIGNMENT.RIGHT), ("[yyyy]", WD_PARAGRAPH_ALIGNMENT.RIGHT),
+                           ("[M]", WD_PARAGRAPH_ALIGNMENT.CENTER), ("[m]", WD_PARAGRAPH_ALIGNMENT.CENTER),
+                           ("[d]", WD_PARAGRAPH_ALIGNMENT.CENTER), ("[D]", WD_PARAGRAPH_ALIGNMENT.CENTER)):
+        token_style[replacements[key]] = (Pt(8), True, 'Arial (Body CS)', alignment)
+
     # استبدال النصوص داخل الجداول وتعديل التنسيقات
+    # الخلايا المدمجة تتكرر في row.cells، لذا نعالج كل خلية مرة واحدة فقط
+    seen_cells = set()
     for table in doc.tables:
         for row in table.rows:
             for cell in row.cells:
-                for key, value in replacements.items():
-                    if key in cell.text:
-                        cell.text = cell.text.replace(key, str(value))
+                if cell._tc in seen_cells:
+                    continue
+                seen_cells.add(cell._tc)
+
+                # تخطي الاستبدال في الخلايا التي لا تحتوي على أي رمز من رموز المفاتيح
+                cell_text = cell.text
+                if '(' in cell_text or '[' in cell_text:
+                    for paragraph in cell.paragraphs:
+                        replace_in_paragraph(paragraph, replacement_pattern, replacements)
                 
                 for paragraph in cell.paragraphs:
                     for run in paragraph.runs:
                         text = run.text.strip()
                         if "لموضح هوياتهم بالبيان" in text:
-                            run.font.size = Pt(15)
-                            run.font.bold = False
-                            run.font.name = 'Times New Roman (Headings CS)'
-                            paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
-                        elif text in {replacements.get("[D]"), replacements.get("[M]"), 
-                                      replacements.get("[Y]"), replacements.get("[d]"), 
-                                      replacements.get("[m]"), replacements.get("[yyyy]")}:
-                            run.font.size = Pt(8)
-                            run.font.bold = True  
-                            run.font.name = 'Arial (Body CS)'
-                            if text in {replacements.get("[d]"), replacements.get("[D]")}:
-                                paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
-                            elif text in {replacements.get("[M]"), replacements.get("[m]")}:
-                                paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER       
-                            elif text in {replacements.get("[Y]"), replacements.get("[yyyy]")}:
-                                paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT
-                        elif text in {p.name for p in people} | {p.nationality for p in people} | {p.id_number for p in people} | {day}:
-                            run.font.size = Pt(15)
-                            run.font.bold = True  
-                            paragraph.alignment = WD_PARAGRAPH_ALIGNMENT.RIGHT 
+                            style = notice_style
                         else:
-                            run.font.size = Pt(15)
-                            run.font.bold = True
-                            run.font.name = 'Times New Roman (Headings CS)'
+                            style = token_style.get(text, default_style)
+                        size, bold, font_name, alignment = style
+                        run.font.size = size
+                        run.font.bold = bold
+                        if font_name is not None:
+                            run.font.name = font_name
+                        if alignment is not None:
+                            paragraph.alignment = alignment
 
     # إذا كان عدد الزوار أكثر من 2، أضف جميع الزوار إلى الجدول الثاني
     if num_people > 2:
@@ -228,86 +338,88 @@ def process_document(date_info, people, template_file, output_file):
         table = doc.tables[1]  # الجدول الثاني في المستند
         
         # إضافة البيانات إلى الجدول الثاني لجميع الزوار
+        rows = list(table.rows)
+        existing_rows = len(rows)
         for i, person in enumerate(people, start=1):
-            # تأكد من أن هناك صفوف كافية
-            if i <= len(table.rows) - 1:  # نبدأ من الصف الأول في الجدول الثاني
-                row = table.rows[i]
-            else:
-                # إضافة صف جديد إذا لم يكن هناك صفوف كافية
-                row = table.add_row()
+            # نبدأ من الصف الأول في الجدول الثاني، ونضيف صفاً جديداً إذا لم تكن هناك صفوف كافية
+            row = rows[i] if i < existing_rows else table.add_row()
+            cells = row.cells[:3]
             
             # ملء البيانات في الصف
-            row.cells[0].text = person.id_number
-            row.cells[1].text = person.nationality
-            row.cells[2].text = person.name
+            cells[0].text = person.id_number
+            cells[1].text = person.nationality
+            cells[2].text = person.name
             
             # تطبيق التنسيق على الخلايا
-            for j in range(3):
-                set_cell_style(row.cells[j])
-
-
-    embed_fonts(doc)
+            for cell in cells:
+                set_cell_style(cell)
 
     doc.save(output_file)
-    logger.info(f"تم إنشاء الملف بنجاح: {output_file}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("تم إنشاء الملف بنجاح: %s", output_file)
     return output_file
 
-def convert_to_pdf(docx_file, pdf_file):
+async def convert_many_to_pdf(docx_files, out_dir):
     """
-    Convert a Word document to PDF using unoconv with explicit Python path
-    Returns True if successful, False otherwise
+    Convert several Word documents to PDF with a single headless LibreOffice run
+    The subprocess is awaited, so the event loop keeps serving other requests meanwhile
+    Returns the list of PDF paths (in the same order as docx_files), or None if conversion failed
     """
     try:
-        # Use the Python that has UNO installed
-        python_with_uno = "/usr/bin/python3"
+        # Full path to LibreOffice
+        soffice_path = "/usr/bin/soffice"
         
-        # Full path to unoconv
-        unoconv_path = "/usr/bin/unoconv"
-        
-        cmd = [python_with_uno, unoconv_path, '-f', 'pdf', '-o', pdf_file, docx_file]
+        cmd = [soffice_path, '--headless', '--convert-to', 'pdf', '--outdir', out_dir, *docx_files]
         
         logger.info(f"Running conversion command: {' '.join(cmd)}")
         
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
         
         if process.returncode != 0:
-            stderr_output = stderr.decode()
-            logger.error(f"Error converting to PDF: {stderr_output}")
-            return False
+            logger.error(f"Error converting to PDF: {stderr.decode()}")
+            return None
+        
+        pdf_files = [
+            os.path.join(out_dir, os.path.splitext(os.path.basename(docx_file))[0] + ".pdf")
+            for docx_file in docx_files
+        ]
         
-        # Check if the output file exists
-        if not os.path.exists(pdf_file):
-            logger.error(f"PDF file was not created: {pdf_file}")
-            return False
+        # Check if every output file exists
+        for pdf_file in pdf_files:
+            if not os.path.exists(pdf_file):
+                logger.error(f"PDF file was not created: {pdf_file}")
+                return None
             
-        logger.info(f"Successfully converted {docx_file} to {pdf_file}")
-        return True
+        logger.info(f"Successfully converted {len(docx_files)} documents to PDF")
+        return pdf_files
     except Exception as e:
         logger.error(f"Error in PDF conversion: {str(e)}")
-        return False
+        return None
 
-def merge_pdfs(pdf_files, output_file):
+def merge_pdfs(pdf_files):
     """
-    Merge multiple PDF files into one using PyPDF2
-    Returns True if successful, False otherwise
+    Merge multiple PDF files into one in memory using pypdf
+    Returns the merged PDF bytes, or None if merging failed
     """
     try:
-        # Use PDFMerger from PyPDF2
-        import PyPDF2
+        from pypdf import PdfWriter
         
-        merger = PyPDF2.PdfMerger()
+        writer = PdfWriter()
         
+        # Skip outline import; the generated passes have no bookmarks worth keeping
         for pdf in pdf_files:
-            merger.append(pdf)
+            writer.append(pdf, import_outline=False)
             
-        merger.write(output_file)
-        merger.close()
+        buffer = io.BytesIO()
+        writer.write(buffer)
         
-        return True
+        return buffer.getvalue()
     except Exception as e:
         logger.error(f"Error merging PDFs: {str(e)}")
-        return False
+        return None
 
 def create_docx_zip(docx_files, output_zip):
     """
@@ -322,213 +434,153 @@ def create_docx_zip(docx_files, output_zip):
         logger.error(f"Error creating ZIP file: {str(e)}")
         return False
 
+_BODY_SPLIT_PATTERN = re.compile(r'(<w:body(?:\s[^>]*)?>|</w:body>)')
+_PAGE_BREAK_XML = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
 def merge_docx_files(docx_files, output_file):
     """
     Merge multiple Word documents into one
+    All inputs must come from the same template: their document.xml bodies are spliced
+    into the first file, whose other parts (styles, media, relationships) are reused as-is
     """
     try:
-        # Use the first document as the base
-        merged_doc = Document(docx_files[0])
+        bodies = []
+        for docx_file in docx_files:
+            with ZipFile(docx_file) as zipf:
+                document_xml = zipf.read('word/document.xml').decode('utf-8')
+            # [قبل الجسم، <w:body>، محتوى الجسم، </w:body>، بعد الجسم]
+            bodies.append(_BODY_SPLIT_PATTERN.split(document_xml, maxsplit=2))
         
-        # Add a page break after the first document
-        merged_doc.add_page_break()
+        head, body_open, _, body_close, tail = bodies[0]
         
-        # Append each additional document
-        for i in range(1, len(docx_files)):
-            doc = Document(docx_files[i])
-            
-            # Copy all elements from the document
-            for element in doc.element.body:
-                merged_doc.element.body.append(element)
-            
-            # Add a page break after each document (except the last one)
-            if i < len(docx_files) - 1:
-                merged_doc.add_page_break()
+        parts = [head, body_open]
+        for i, (_, _, body, _, _) in enumerate(bodies):
+            if i < len(bodies) - 1:
+                # Only the last document keeps its section properties, which must end the body
+                sect_start = body.rfind('<w:sectPr')
+                if sect_start != -1:
+                    body = body[:sect_start]
+                parts.append(body)
+                # Add a page break after each document (except the last one)
+                parts.append(_PAGE_BREAK_XML)
+            else:
+                parts.append(body)
+        parts.extend([body_close, tail])
         
-        # Save the merged document
-        merged_doc.save(output_file)
+        # Copy every other part of the first document unchanged
+        with ZipFile(docx_files[0]) as source, ZipFile(output_file, 'w', ZIP_DEFLATED) as target:
+            for item in source.infolist():
+                if item.filename == 'word/document.xml':
+                    target.writestr(item, ''.join(parts).encode('utf-8'))
+                else:
+                    target.writestr(item, source.read(item.filename))
         return True
     except Exception as e:
         logger.error(f"Error merging Word documents: {str(e)}")
         return False
 
-# @app.post("/generate-getpass/")
-# async def generate_getpass(data: GetPassData):
-#     try:
-#         # Create a temporary directory for working files
-#         with tempfile.TemporaryDirectory() as temp_dir:
-#             template_file = "GETPASS.docx"  # Path to your template file
-#             docx_files = []
-#             pdf_files = []
-#             conversion_success = True
-            
-#             # Process each date entry
-#             for i, date_entry in enumerate(data.dates):
-#                 try:
-#                     # Fix timezone issues by ensuring we have a complete datetime
-#                     date_str = date_entry.date
-#                     if 'T' not in date_str:
-#                         # If only a date is provided (YYYY-MM-DD), add time component
-#                         date_str = f"{date_str}T12:00:00"
-                    
-#                     # Convert Gregorian date to Hijri with correct handling
-#                     date_info = convert_to_hijri(date_str)
-                    
-#                     docx_file = os.path.join(temp_dir, f"getpass_{i}.docx")
-#                     pdf_file = os.path.join(temp_dir, f"getpass_{i}.pdf")
-                    
-#                     # Process the document with converted date
-#                     processed_docx = process_document(date_info, data.people, template_file, docx_file)
-#                     docx_files.append(processed_docx)
-                    
-#                     # Try to convert to PDF
-#                     if convert_to_pdf(docx_file, pdf_file):
-#                         pdf_files.append(pdf_file)
-#                     else:
-#                         conversion_success = False
-#                         logger.warning(f"Failed to convert {docx_file} to PDF")
-                        
-#                 except ValueError as e:
-#                     logger.error(f"Invalid date format: {e}")
-#                     raise HTTPException(status_code=400, detail=f"Invalid date format: {str(e)}")
-            
-#             # Create output directory
-#             output_dir = "output"
-#             os.makedirs(output_dir, exist_ok=True)
-            
-#             # If PDF conversion was successful and there are multiple PDFs
-#             if conversion_success and len(pdf_files) > 1:
-#                 final_pdf_path = os.path.join(output_dir, "getpass.pdf")
-#                 if merge_pdfs(pdf_files, final_pdf_path):
-#                     return FileResponse(
-#                         path=final_pdf_path,
-#                         filename="getpass.pdf",
-#                         media_type="application/pdf"
-#                     )
-#                 else:
-#                     # If merging PDFs fails, fall back to Word documents
-#                     conversion_success = False
-            
-#             # If PDF conversion was successful but there's only one PDF
-#             elif conversion_success and len(pdf_files) == 1:
-#                 final_pdf_path = os.path.join(output_dir, "getpass.pdf")
-#                 shutil.copy2(pdf_files[0], final_pdf_path)
-#                 return FileResponse(
-#                     path=final_pdf_path,
-#                     filename="getpass.pdf",
-#                     media_type="application/pdf"
-#                 )
-            
-#             # If PDF conversion failed or PDF merging failed, return merged Word document
-#             if not conversion_success:
-#                 if len(docx_files) == 1:
-#                     # Return a single Word document
-#                     final_docx_path = os.path.join(output_dir, "getpass.docx")
-#                     shutil.copy2(docx_files[0], final_docx_path)
-#                     return FileResponse(
-#                         path=final_docx_path,
-#                         filename="getpass.docx",
-#                         media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-#                     )
-#                 else:
-#                     # Merge multiple Word documents instead of creating a ZIP
-#                     final_docx_path = os.path.join(output_dir, "getpass.docx")
-#                     if merge_docx_files(docx_files, final_docx_path):
-#                         return FileResponse(
-#                             path=final_docx_path,
-#                             filename="getpass.docx",
-#                             media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-#                         )
-#                     else:
-#                         # If merging Word documents fails, fall back to ZIP
-#                         zip_path = os.path.join(output_dir, "getpass_documents.zip")
-#                         with ZipFile(zip_path, 'w') as zipf:
-#                             for docx_file in docx_files:
-#                                 zipf.write(docx_file, os.path.basename(docx_file))
-#                         return FileResponse(
-#                             path=zip_path,
-#                             filename="getpass_documents.zip",
-#                             media_type="application/zip"
-#                         )
-            
-#             # If we got here, something unexpected happened
-#             raise HTTPException(status_code=500, detail="Failed to generate documents")
-            
-#     except Exception as e:
-#         logger.error(f"Error processing request: {str(e)}")
-#         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+def _build_one(date_info, people_ctx, template_bytes, output_dir):
+    """
+    Build the document for a single date inside a worker process
+    Returns the filename of the generated document
+    """
+    # Extract the Gregorian date for the filename
+    _, _, gregorian_parts = date_info
+    date_for_filename = '-'.join(gregorian_parts)
+
+    # Create output filename with date
+    output_filename = f"getpass_{date_for_filename}.docx"
+    output_path = os.path.join(output_dir, output_filename)
+
+    # Process the document
+    process_document(date_info, people_ctx, template_bytes, output_path)
+    return output_filename
 
 @app.post("/generate-getpass/")
 async def generate_getpass(data: GetPassData, request: Request):
+    temp_dir = None
     try:
-        # Create a temporary directory for working files
-        with tempfile.TemporaryDirectory() as temp_dir:
-            template_file = "GETPASS.docx"  # Path to your template file
-            
-            # Create output directory
-            output_dir = "output"
-            os.makedirs(output_dir, exist_ok=True)
-            
+        template_file = "GETPASS.docx"  # Path to your template file
+        
+        # Convert all dates up front so invalid input fails before any work is scheduled
+        date_infos = []
+        for date_entry in data.dates:
+            try:
+                # Convert Gregorian date to Hijri
+                date_infos.append(convert_to_hijri(date_entry.date))
+            except ValueError as e:
+                logger.error(f"Invalid date format: {e}")
+                raise HTTPException(status_code=400, detail=f"Invalid date format: {str(e)}")
+
+        # A single document is streamed straight back, so it only needs a temporary directory
+        # (removed after the response is sent); multiple documents are kept under output/
+        # for the download route
+        if len(date_infos) == 1:
+            temp_dir = tempfile.mkdtemp()
+            build_dir = temp_dir
+        else:
             # Create a unique session ID for this batch of files
             session_id = datetime.now().strftime("%Y%m%d%H%M%S")
-            session_dir = os.path.join(output_dir, session_id)
-            os.makedirs(session_dir, exist_ok=True)
-            
-            output_files = []
-            
-            # Process each date entry
-            for i, date_entry in enumerate(data.dates):
-                try:
-                    # Convert Gregorian date to Hijri
-                    date_info = convert_to_hijri(date_entry.date)
-                    
-                    # Extract the Gregorian date for the filename
-                    _, _, gregorian_date_str = date_info
-                    date_for_filename = gregorian_date_str.replace('/', '-')
-                    
-                    # Create output filename with date
-                    output_filename = f"getpass_{date_for_filename}.docx"
-                    output_path = os.path.join(session_dir, output_filename)
-                    
-                    # Process the document
-                    process_document(date_info, data.people, template_file, output_path)
-                    
-                    # Add file info to output list
-                    file_url = f"/download-file/{session_id}/{output_filename}"
-                    output_files.append({
-                        "filename": output_filename,
-                        "url": file_url
-                    })
-                        
-                except ValueError as e:
-                    logger.error(f"Invalid date format: {e}")
-                    raise HTTPException(status_code=400, detail=f"Invalid date format: {str(e)}")
-            
-            # If only one file, return it directly with proper headers
-            if len(output_files) == 1:
-                file_path = os.path.join(session_dir, output_files[0]["filename"])
-                filename = output_files[0]["filename"]
-                
-                return FileResponse(
-                    path=file_path,
-                    filename=filename,
-                    media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    headers={
-                        "Content-Disposition": f'attachment; filename="{filename}"'
-                    }
-                )
-            
-            # If multiple files, return JSON with file data
-            host = request.headers.get("host", "localhost:8000")
-            protocol = "https" if request.headers.get("x-forwarded-proto") == "https" else "http"
-            base_url = f"{protocol}://{host}"
+            build_dir = os.path.join("output", session_id)
+            os.makedirs(build_dir, exist_ok=True)
+
+        # Read the template and prepare the people data once, then hand them to every worker
+        template_bytes = _template_bytes(template_file, os.path.getmtime(template_file))
+        people_ctx = build_people_context(data.people)
+
+        # Process the date entries without blocking the event loop; a single date runs in the
+        # default thread pool, several run in parallel worker processes.
+        # gather() keeps the results in request order
+        loop = asyncio.get_running_loop()
+        if len(date_infos) == 1:
+            output_filenames = [
+                await loop.run_in_executor(None, _build_one, date_infos[0], people_ctx, template_bytes, build_dir)
+            ]
+        else:
+            max_workers = max(1, min(len(date_infos), os.cpu_count() or 1))
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                output_filenames = await asyncio.gather(*[
+                    loop.run_in_executor(executor, _build_one, date_info, people_ctx, template_bytes, build_dir)
+                    for date_info in date_infos
+                ])
+
+        # If only one file, return its bytes directly with proper headers
+        if len(output_filenames) == 1:
+            filename = output_filenames[0]
+            with open(os.path.join(build_dir, filename), 'rb') as f:
+                content = f.read()
             
-            return {
-                "files": output_files,
-                "baseUrl": base_url
-            }
+            return Response(
+                content=content,
+                media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                headers={
+                    "Content-Disposition": f'attachment; filename="{filename}"'
+                },
+                background=BackgroundTask(shutil.rmtree, temp_dir, ignore_errors=True)
+            )
+        
+        output_files = []
+        for output_filename in output_filenames:
+            # Add file info to output list
+            file_url = f"/download-file/{session_id}/{output_filename}"
+            output_files.append({
+                "filename": output_filename,
+                "url": file_url
+            })
+        
+        # If multiple files, return JSON with file data
+        host = request.headers.get("host", "localhost:8000")
+        protocol = "https" if request.headers.get("x-forwarded-proto") == "https" else "http"
+        base_url = f"{protocol}://{host}"
+        
+        return {
+            "files": output_files,
+            "baseUrl": base_url
+        }
             
     except Exception as e:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
         logger.error(f"Error processing request: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
 